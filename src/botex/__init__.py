@@ -1,8 +1,68 @@
-from botex.bot import *
-from botex.otree import *
-from botex.botex_db import *
-from botex.llamacpp import *
+import importlib
+
 from botex.logger import setup_logging
 from botex.env import load_botex_env
+# Imported eagerly as the function would otherwise be shadowed by the 
+# botex.completion submodule once botex.bot imports it. The module only 
+# imports LiteLLM on first use, so this is cheap.
+from botex.completion import completion, model_supports_response_schema
 
 logger = setup_logging()
+
+# The API is loaded lazily on first attribute access so that importing
+# the package (e.g., by the `botex` command line interface) does not pay
+# for importing LiteLLM, instructor, selenium and friends up front.
+_LAZY_MODULES = {
+    'botex.bot': [
+        'create_prompts', 'run_bot', 'MAX_NUM_OF_ANSWER_ATTEMPTS',
+        'MAX_NUM_OF_SCRAPE_ATTEMPTS', 'MAX_NUM_OF_ATTEMPTS_TO_START_CHROME',
+        'TEST_FORM_VALIDATION_ERRORS'
+    ],
+    'botex.schemas': [
+        'Phase', 'StartSchema', 'SummarySchema', 'EndSchema',
+        'create_answers_response_model'
+    ],
+    'botex.gguf_parser': [
+        'GGUFParser'
+    ],
+    'botex.otree': [
+        'setup_botex_db', 'call_otree_api', 'otree_server_is_running',
+        'start_otree_server', 'stop_otree_server', 'get_session_configs',
+        'init_otree_session', 'get_bot_urls', 'run_bots_on_session',
+        'run_single_bot', 'export_otree_data', 'normalize_otree_data'
+    ],
+    'botex.botex_db': [
+        'retrieve_responses', 'parse_history', 'parse_conversation',
+        'read_participants_from_botex_db', 'read_conversations_from_botex_db',
+        'read_responses_from_botex_db', 'export_participant_data',
+        'export_response_data'
+    ],
+    'botex.llamacpp': [
+        'Message', 'Choice', 'Usage', 'ChatCompletionResponse',
+        'LlamaCppConfig', 'is_llamacpp_server_reachable',
+        'LlamaCppServerManager', 'LlamaCpp', 'start_llamacpp_server',
+        'stop_llamacpp_server'
+    ],
+}
+
+_LAZY_ATTRS = {
+    name: module for module, names in _LAZY_MODULES.items() for name in names
+}
+
+__all__ = [
+    'logger', 'setup_logging', 'load_botex_env', 'completion',
+    'model_supports_response_schema', *_LAZY_ATTRS
+]
+
+
+def __getattr__(name):
+    module = _LAZY_ATTRS.get(name)
+    if module is None:
+        raise AttributeError(f"module 'botex' has no attribute '{name}'")
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRS))
@@ -1,36 +1,15 @@
 import json
 import time
 from datetime import datetime, timezone
-import sqlite3
 import csv
 from importlib.resources import files
 import re
+import sys
+from functools import lru_cache
+from types import MappingProxyType
 import logging
 logger = logging.getLogger("botex")
 
-import warnings
-from importlib.metadata import version, PackageNotFoundError
-
-# Starting with v1.56.2, LiteLLM triggers a user Pydantic user warning
-# we will filter this out until the issue is resolved  
-try:
-    litellm_version = version("litellm")
-    logger.info(f"LiteLLM version: {litellm_version}")
-except PackageNotFoundError:
-    logger.error(f"LiteLLM not installed")
-
-if litellm_version >= "1.56.2":
-    with warnings.catch_warnings():
-        warnings.simplefilter('ignore')
-        import litellm
-else:
-    import litellm
-
-litellm.suppress_debug_info = True
-litellm.set_verbose = False
-logging.getLogger("LiteLLM").setLevel(logging.ERROR)
-
-
 from pydantic import ValidationError
 from selenium import webdriver
 from selenium.webdriver.support.wait import WebDriverWait
@@ -39,9 +18,9 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException
 
-from .llamacpp import LlamaCpp
 from .schemas import create_answers_response_model, EndSchema, Phase, StartSchema, SummarySchema
 from .completion import model_supports_response_schema, completion
+from .botex_db import connect_botex_db, close_botex_db
 
 
 MAX_NUM_OF_ANSWER_ATTEMPTS = 3
@@ -50,14 +29,23 @@ MAX_NUM_OF_ATTEMPTS_TO_START_CHROME = 5
 
 TEST_FORM_VALIDATION_ERRORS = False
 
-def create_prompts(user_prompts):
+@lru_cache(maxsize=None)
+def read_default_prompts():
+    # The default prompts do not change while botex runs, so the CSV file 
+    # is only parsed once. Keys are interned as they are looked up often.
     with open(
         files('botex').joinpath('bot_prompts.csv'), 
         'r', newline='', encoding='utf-8'
     ) as f:
         rv = csv.reader(f)
         next(rv)
-        prompts = {row[0]:row[1].replace(r'\n', '\n') for row in rv}
+        prompts = {
+            sys.intern(row[0]): row[1].replace(r'\n', '\n') for row in rv
+        }
+    return MappingProxyType(prompts)
+
+def create_prompts(user_prompts):
+    prompts = dict(read_default_prompts())
     
     if user_prompts:
         for key in user_prompts:
@@ -94,7 +82,11 @@ def run_bot(**kwargs):
     prompts = create_prompts(user_prompts)
 
     if model == "llamacpp":
-        llamacpp = LlamaCpp(kwargs.get("api_base"))
+        from .llamacpp import LlamaCpp
+        llamacpp = LlamaCpp(
+            kwargs.get("api_base"), 
+            cache_prompt=kwargs.pop("cache_prompt", True)
+        )
         bot_parms['model'] = llamacpp.json_dump_model_cfg()
     else:
         llamacpp = None
@@ -306,9 +298,10 @@ def run_bot(**kwargs):
             attempts += 1
             if error:
                 append_message_to_conversation({"role": "user", "content": message})
-                logger.info(
-                    f"Sending the following conversation to the llm to fix error:\n{json.dumps(conversation, indent=4)}"
-                )
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info(
+                        f"Sending the following conversation to the llm to fix error:\n{json.dumps(conversation, indent=4)}"
+                    )
             
             resp = completion(
                 llamacpp=llamacpp, model=model,
@@ -330,13 +323,15 @@ def run_bot(**kwargs):
                 continue
 
             try:
-                assert resp_str, "Bot's response is empty."
+                if not resp_str:
+                    raise ValueError("Bot's response is empty.")
                 start = resp_str.find('{', 0)
                 end = resp_str.rfind('}', start)
                 resp_str = resp_str[start:end+1]
                 resp_dict = json.loads(resp_str, strict = False)
                 error = False
-            except (AssertionError, json.JSONDecodeError):
+            except ValueError:
+                # json.JSONDecodeError is a subclass of ValueError
                 logger.warning("Bot's response is not a valid JSON.")
                 resp_dict = None
                 error = True
@@ -349,17 +344,18 @@ def run_bot(**kwargs):
                 if not success:
                     error = True
                     logger.warning(f"Detected an issue: {' '.join(error_logs)}.")
-                    message = ''
+                    parts = []
                     for i, error_msg in enumerate(error_msgs):
                         if ':' in error_msg:
                             err, ids = error_msg.split(": ", 1)
                             f_dict = {err: ids}
                             if i == 0:
-                                message += prompts[err].format(**f_dict) + ' '
+                                parts.append(prompts[err].format(**f_dict))
                             else:
-                                message += 'Additionally, ' + prompts[err].format(**f_dict) + ' '
+                                parts.append('Additionally, ' + prompts[err].format(**f_dict))
                         else:
-                            message += prompts[error_msg] + ' '
+                            parts.append(prompts[error_msg])
+                    message = ''.join(part + ' ' for part in parts)
                     resp_dict = None
                     continue
 
@@ -425,6 +421,7 @@ def run_bot(**kwargs):
             result = "Bot could not provide a valid response. Exiting."        
         conv_hist_botex_db.append({"role": "system", "content": result})
         store_data(botex_db, session_id, url, conv_hist_botex_db, bot_parms)
+        if llamacpp: llamacpp.close()
         logger.info("Gracefully exiting failed bot.")
         if failure_place != "start" and failure_place != "end":
             dr.close()
@@ -443,40 +440,38 @@ def run_bot(**kwargs):
 
         Returns: None
         """
-        conn = sqlite3.connect(botex_db)
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO conversations (id, bot_parms, conversation) 
-            VALUES (?, ?, ?)
-            """, (url[-8:], bot_parms, json.dumps(conv))
-        )
-        conn.commit()
-        cursor.execute(
+        conn = connect_botex_db(botex_db)
+        with conn:
+            conn.execute(
+                """
+                INSERT INTO conversations (id, bot_parms, conversation) 
+                VALUES (?, ?, ?)
+                """, (
+                    url[-8:], bot_parms, 
+                    json.dumps(conv, separators=(',', ':'), ensure_ascii=False)
+                )
+            )
+            conn.execute(
+                """
+                UPDATE participants SET time_out = ? 
+                WHERE session_id = ? and url = ?
+                """, 
+                (datetime.now(timezone.utc).isoformat(), session_id, url)
+            )
+        close_botex_db(conn)
+        logger.info("Data stored in botex database.")
+
+    
+    conn = connect_botex_db(botex_db)
+    with conn:
+        conn.execute(
             """
-            UPDATE participants SET time_out = ? 
+            UPDATE participants SET time_in = ?
             WHERE session_id = ? and url = ?
             """, 
             (datetime.now(timezone.utc).isoformat(), session_id, url)
         )
-        conn.commit()
-        cursor.close()
-        conn.close()
-        logger.info("Data stored in botex database.")
-
-    
-    conn = sqlite3.connect(botex_db)
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        UPDATE participants SET time_in = ?
-        WHERE session_id = ? and url = ?
-        """, 
-        (datetime.now(timezone.utc).isoformat(), session_id, url)
-    )
-    conn.commit()
-    cursor.close()
-    conn.close()
+    close_botex_db(conn)
 
     if full_conv_history:
         system_prompt = {
@@ -497,7 +492,8 @@ def run_bot(**kwargs):
     if resp == 'Maximum number of attempts reached.':
         gracefully_exit_failed_bot("start")
         return
-    logger.info(f"Bot's response to start message:\n{json.dumps(resp, indent=4)}")
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(f"Bot's response to start message:\n{json.dumps(resp, indent=4)}")
     
     options = Options()
     options.add_argument("--headless=new")
@@ -621,7 +617,8 @@ def run_bot(**kwargs):
             gracefully_exit_failed_bot("middle")
             return
 
-        logger.info(f"Bot's analysis of page:\n{json.dumps(resp, indent=4)}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f"Bot's analysis of page:\n{json.dumps(resp, indent=4)}")
         if not full_conv_history: summary = resp['summary']
         if questions is None and next_button is not None:
             logger.info("Page has no question but next button. Clicking")
@@ -698,6 +695,8 @@ def run_bot(**kwargs):
     if resp == 'Maximum number of attempts reached.':
         gracefully_exit_failed_bot("end")
         return
-    logger.info(f"Bot's final remarks about experiment:\n{json.dumps(resp, indent=4)}")
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(f"Bot's final remarks about experiment:\n{json.dumps(resp, indent=4)}")
     logger.info("Bot finished.")
     store_data(botex_db, session_id, url, conv_hist_botex_db, bot_parms)
+    if llamacpp: llamacpp.close()
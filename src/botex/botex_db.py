@@ -7,6 +7,28 @@ from typing import List, Dict
 
 logger = logging.getLogger("botex")
 
+def connect_botex_db(botex_db) -> sqlite3.Connection:
+    """
+    Open a connection to the botex database. The database is operated in 
+    WAL mode (set by `setup_botex_db()`), so bots running in parallel 
+    threads can read while another bot writes. In WAL mode, 
+    synchronous=NORMAL is safe against corruption and avoids an fsync on 
+    every commit.
+    """
+    conn = sqlite3.connect(botex_db)
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+def close_botex_db(conn: sqlite3.Connection) -> None:
+    """
+    Close a connection to the botex database after writing to it. As 
+    recommended for short-lived connections, `PRAGMA optimize` is run 
+    before closing so that SQLite can refresh the statistics for its 
+    indexes if needed.
+    """
+    conn.execute("PRAGMA optimize")
+    conn.close()
+
 def retrieve_responses(resp_str):
     try:
         resp_str = resp_str
@@ -69,7 +91,7 @@ def read_participants_from_botex_db(session_id = None, botex_db = None) -> List[
     """
 
     if botex_db is None: botex_db = environ.get('BOTEX_DB')
-    conn = sqlite3.connect(botex_db)
+    conn = connect_botex_db(botex_db)
     conn.row_factory = sqlite3.Row 
     cursor = conn.cursor()
     if session_id:
@@ -105,7 +127,7 @@ def read_conversations_from_botex_db(
         A list of dictionaries with the conversation data.
     """
     if botex_db is None: botex_db = environ.get('BOTEX_DB')
-    conn = sqlite3.connect(botex_db)
+    conn = connect_botex_db(botex_db)
     conn.row_factory = sqlite3.Row 
     cursor = conn.cursor()
     if participant_id:
@@ -1,27 +1,20 @@
 import os
+import functools
 import logging
 import textwrap
 import sys
 
 import click
 
-from .otree import get_session_configs, otree_server_is_running, \
-    start_otree_server, stop_otree_server, init_otree_session, \
-    run_bots_on_session
-from .botex_db import export_response_data
-from .llamacpp import is_llamacpp_server_reachable, start_llamacpp_server, stop_llamacpp_server
-from .env import load_botex_env
-
 DEFAULT_LLM = 'gemini/gemini-1.5-flash'
+OTREE_PROBE_TIMEOUT = 5
 
 
+@functools.lru_cache(maxsize=None)
 def tqs(s):
-    # Normalize triple-quoted strings
-    s = textwrap.dedent(s)
-    s = s.replace('\r\n', '\n').replace('\r', '\n')
-    lines = [line.strip() for line in s.split('\n')]
-    lines = [line for line in lines if line]
-    s = ' '.join(lines)
+    # Normalize triple-quoted strings. Lines are stripped individually, 
+    # so neither dedenting nor normalizing line endings is needed.
+    s = ' '.join(line.strip() for line in s.splitlines() if line.strip())
     return textwrap.fill(s, width=80) + "\n"
 
 @click.command(help=tqs("""
@@ -57,6 +50,24 @@ def tqs(s):
         if not provided. Defaults to 'http://localhost:8000'.
     """),
 )
+@click.option(
+    '--start-otree/--no-start-otree', default=None,
+    help=tqs("""
+        Whether botex should start an oTree server. If set, botex does not 
+        check for a running server but starts one right away. If negated, 
+        botex exits when the oTree server is not reachable. If not provided,
+        botex checks whether the server is reachable and asks whether it 
+        should start one if it is not.
+    """),
+)
+@click.option(
+    '--otree-project-path', type=str,
+    help=tqs("""
+        Path to the oTree project folder, used when botex starts the oTree
+        server. Read from environment variable OTREE_PROJECT_PATH if not
+        provided. If neither is set, you will be prompted for the folder.
+    """),
+)
 @click.option(
     '-r', '--otree-rest-key', default=None, type=str, required=False,
     help=tqs("""
@@ -150,6 +161,8 @@ def run_botex(
     ignore,
     botex_db,
     otree_server_url,
+    start_otree,
+    otree_project_path,
     otree_rest_key,
     model,
     api_key,
@@ -164,8 +177,12 @@ def run_botex(
     verbose
 ):
     """Main entry-point for running botex with click-based CLI."""
+    # The heavy modules (LiteLLM, instructor, selenium, ...) are imported 
+    # on the code paths that need them so that `botex --help` stays fast.
+
     # Load environment variables from config (if the file exists and ignore is not set)
     if os.path.exists(config) and not ignore:
+        from .env import load_botex_env
         click.echo(f"Loading botex config from '{config}'")
         load_botex_env(config)
 
@@ -175,33 +192,24 @@ def run_botex(
 
     # If not ignoring environment variables, pull from environment if not passed in
     if not ignore:
-        if not otree_server_url:
-            otree_server_url = os.getenv('OTREE_SERVER_URL')
-        if not otree_rest_key:
-            otree_rest_key = os.getenv('OTREE_REST_KEY')
-        if not session_config:
-            session_config = os.getenv('OTREE_SESSION_CONFIG')
-
-        if not botex_db:
-            botex_db = os.getenv('BOTEX_DB')
-        if not model:
-            model = os.getenv('LLM_MODEL')
-        if not api_key:
-            api_key = os.getenv('API_KEY')
-        if not api_base:
-            api_base = os.getenv('API_BASE')
-        if not llamacpp_server:
-            llamacpp_server = os.getenv('LLAMACPP_SERVER_PATH')
-        if not llamacpp_local_llm:
-            llamacpp_local_llm = os.getenv('LLAMACPP_LOCAL_LLM_PATH')
-        if not nparticipants:
-            env_nparticipants = os.getenv('OTREE_NPARTICIPANTS')
-            if env_nparticipants is not None:
-                nparticipants = int(env_nparticipants)
-        if nhumans is None:
-            env_nhumans = os.getenv('OTREE_NHUMANS')
-            if env_nhumans is not None:
-                nhumans = int(env_nhumans)
+        env = dict(os.environ)
+        otree_server_url = otree_server_url or env.get('OTREE_SERVER_URL')
+        otree_rest_key = otree_rest_key or env.get('OTREE_REST_KEY')
+        otree_project_path = \
+            otree_project_path or env.get('OTREE_PROJECT_PATH')
+        session_config = session_config or env.get('OTREE_SESSION_CONFIG')
+
+        botex_db = botex_db or env.get('BOTEX_DB')
+        model = model or env.get('LLM_MODEL')
+        api_key = api_key or env.get('API_KEY')
+        api_base = api_base or env.get('API_BASE')
+        llamacpp_server = llamacpp_server or env.get('LLAMACPP_SERVER_PATH')
+        llamacpp_local_llm = \
+            llamacpp_local_llm or env.get('LLAMACPP_LOCAL_LLM_PATH')
+        if not nparticipants and 'OTREE_NPARTICIPANTS' in env:
+            nparticipants = int(env['OTREE_NPARTICIPANTS'])
+        if nhumans is None and 'OTREE_NHUMANS' in env:
+            nhumans = int(env['OTREE_NHUMANS'])
 
     click.echo() 
 
@@ -219,26 +227,41 @@ def run_botex(
         )
         otree_server_url = 'http://localhost:8000'
 
-    # Check if oTree server is reachable
-    otree_available = otree_server_is_running(
-        server_url = otree_server_url, 
-        rest_key = otree_rest_key
-    )
-    if not otree_available:
-        click.echo(f"oTree server at '{otree_server_url}' is not reachable.")
-        click.echo()
-        confirm = click.confirm(
-            'Do you want me to start an otree instance?', 
-            default=True
+    from .otree import get_session_configs, otree_server_is_running, \
+        start_otree_server, stop_otree_server, init_otree_session, \
+        run_bots_on_session
+
+    # Check if oTree server is reachable (unless we are asked to start it)
+    if start_otree:
+        otree_available = False
+    else:
+        otree_available = otree_server_is_running(
+            server_url = otree_server_url, 
+            rest_key = otree_rest_key,
+            timeout = OTREE_PROBE_TIMEOUT
         )
-        if not confirm:
+    otree_process = None
+    if not otree_available:
+        if not start_otree:
+            click.echo(f"oTree server at '{otree_server_url}' is not reachable.")
+            click.echo()
+        # With --start-otree, a known project folder is used right away
+        prompt_for_project_path = not (start_otree and otree_project_path)
+        if start_otree is None:
+            start_otree = click.confirm(
+                'Do you want me to start an otree instance?', 
+                default=True
+            )
+        if not start_otree:
             click.echo("Exiting...")
             click.echo()
             sys.exit(1)
         else:
-            otree_project_path = click.prompt(
-                'Enter your oTree project folder', default='otree'
-            )
+            if prompt_for_project_path:
+                otree_project_path = click.prompt(
+                    'Enter your oTree project folder', 
+                    default=otree_project_path or 'otree'
+                )
             if otree_rest_key:
                 click.echo(
                     f"Starting oTree server at '{otree_server_url}' with "
@@ -250,11 +273,10 @@ def run_botex(
                 )
             else:
                 click.echo(f"Starting oTree server at '{otree_server_url}'...")
-                start_otree_server(otree_project_path)
+                otree_process = start_otree_server(otree_project_path)
             
     else:
         click.echo(f"oTree server at '{otree_server_url}' is reachable.")
-        otree_process = None
 
     # If model is not provided, check if llama.cpp is feasible or prompt
     if not model:
@@ -279,6 +301,8 @@ def run_botex(
 
     # Handle llama.cpp
     if model == "llamacpp":
+        from .llamacpp import is_llamacpp_server_reachable, \
+            start_llamacpp_server
         llamacpp_process = None
         if not api_base:
             api_base = "http://localhost:8080"
@@ -406,6 +430,7 @@ def run_botex(
 
     # If we launched a llama.cpp process, shut it down
     if model == "llamacpp" and 'llamacpp_process' in locals() and llamacpp_process:
+        from .llamacpp import stop_llamacpp_server
         click.echo("Stopping llama.cpp server...")
         stop_llamacpp_server(llamacpp_process)
 
@@ -428,6 +453,7 @@ def run_botex(
             csv_file = None
 
     if csv_file:
+        from .botex_db import export_response_data
         export_response_data(csv_file, botex_db, session_id)
     
     if otree_process:
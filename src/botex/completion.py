@@ -2,38 +2,64 @@ import logging
 logger = logging.getLogger("botex")
 
 import warnings
-from importlib.metadata import version, PackageNotFoundError
-
-# Starting with v1.56.2, LiteLLM triggers a user Pydantic user warning
-# we will filter this out until the issue is resolved  
-try:
-    litellm_version = version("litellm")
-    logger.info(f"LiteLLM version: {litellm_version}")
-except PackageNotFoundError:
-    logger.error(f"LiteLLM not installed")
-
-if litellm_version >= "1.56.2":
-    with warnings.catch_warnings():
-        warnings.simplefilter('ignore')
-        import litellm
-else:
-    import litellm
-
-import instructor
-from instructor.exceptions import InstructorRetryException
+from importlib.metadata import version
 
+from functools import lru_cache
 from random import random
 import time
 
+# LiteLLM and instructor are expensive to import. They are imported on first
+# use and the instructor client is created on first use as well.
+_litellm = None
+_instructor_client = None
 
+def _import_litellm():
+    """
+    Import LiteLLM on first use, silencing the Pydantic user warnings that
+    LiteLLM triggers on import (starting with v1.56.2), and configure it 
+    for botex.
+    """
+    global _litellm
+    if _litellm is not None:
+        return _litellm
 
-instructor_client = instructor.from_litellm(litellm.completion)
-
+    with warnings.catch_warnings():
+        warnings.filterwarnings(
+            'ignore', category=UserWarning, module=r'pydantic|litellm'
+        )
+        import litellm
+    logger.info(f"LiteLLM version: {version('litellm')}")
+
+    litellm.suppress_debug_info = True
+    litellm.set_verbose = False
+    logging.getLogger("LiteLLM").setLevel(logging.ERROR)
+    _litellm = litellm
+    return _litellm
+
+def _get_instructor_client():
+    global _instructor_client
+    if _instructor_client is None:
+        import instructor
+        litellm = _import_litellm()
+        _instructor_client = instructor.from_litellm(litellm.completion)
+        _instructor_client.on("completion:response", log_completion_response)
+    return _instructor_client
+
+def __getattr__(name):
+    if name == "litellm":
+        return _import_litellm()
+    if name == "instructor_client":
+        return _get_instructor_client()
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+@lru_cache(maxsize=256)
 def model_supports_response_schema(
         model: str, custom_llm_provider: str = None
     ) -> bool:
     """
     Check if litellm supports response schema for a given model string.
+    The result is cached as it does not change during the lifetime of a 
+    process.
 
     Args:
         model (str): The model name.
@@ -43,11 +69,10 @@ def model_supports_response_schema(
         bool: True if the model supports response schema, False otherwise.
     """
     if model == "llamacpp": return True 
-    if custom_llm_provider is None or not custom_llm_provider:
-        if "/" not in model:
-            custom_llm_provider = "openai"
-        else:
-            custom_llm_provider = model.split("/")[0]
+    litellm = _import_litellm()
+    if not custom_llm_provider:
+        prefix, sep, _ = model.partition("/")
+        custom_llm_provider = prefix if sep else "openai"
     params = litellm.get_supported_openai_params(
         model=model, custom_llm_provider=custom_llm_provider
     )
@@ -62,8 +87,6 @@ def log_completion_response(response) -> None:
     print("## Completion response:")
     print(response.model_dump())
 
-instructor_client.on("completion:response", log_completion_response)
-
 def instructor_completion(**kwargs):
     """
     Wrapper function for instructor client completion.
@@ -74,10 +97,11 @@ def instructor_completion(**kwargs):
     Returns:
         dict: The response JSON string and finish reason.
     """
+    from instructor.exceptions import InstructorRetryException
+
     response_format = kwargs.pop("response_format")
-    kwargs.pop("throttle", None)
     try:
-        resp_instructor = instructor_client.chat.completions.create(
+        resp_instructor = _get_instructor_client().chat.completions.create(
             response_model=response_format,
             max_tokens=131071,
             **kwargs
@@ -95,7 +119,8 @@ def instructor_completion(**kwargs):
 
 def litellm_completion(**kwargs):
     """
-    Wrapper function for LiteLLM completion.
+    Wrapper function for LiteLLM completion. If the request fails and 
+    throttling is not enabled, the request is retried with throttling.
 
     Args:
         **kwargs: The keyword arguments.
@@ -103,17 +128,18 @@ def litellm_completion(**kwargs):
     Returns:
         dict: The response JSON string and finish reason.
     """
-    if not kwargs.get("throttle"):
-        try:
-            resp_litellm = litellm.completion(**kwargs)
-        except Exception as e:
-            logger.warning(f"Litellm completion failed, error: '{e}'")
-            logger.info("Retrying with throttling.")
-            kwargs["throttle"] = True
-            return litellm_completion_with_backoff(**kwargs)
-    else:
-        kwargs.pop("throttle", None)
-        resp_litellm = litellm.completion(**kwargs)
+    if kwargs.pop("throttle", False):
+        return litellm_completion_with_backoff(**kwargs)
+    try:
+        return _litellm_completion(**kwargs)
+    except Exception as e:
+        logger.warning(f"Litellm completion failed, error: '{e}'")
+        logger.info("Retrying with throttling.")
+        return litellm_completion_with_backoff(**kwargs)
+
+def _litellm_completion(**kwargs):
+    litellm = _import_litellm()
+    resp_litellm = litellm.completion(**kwargs)
     resp = {
         'resp_str': resp_litellm.choices[0].message.content,
         'finish_reason': resp_litellm.choices[0].finish_reason
@@ -134,11 +160,10 @@ def llamacpp_completion(**kwargs):
     llamacpp = kwargs.get("llamacpp")
     messages = kwargs.get("messages")
     response_format = kwargs.get("response_format")
-    resp_llamacpp = llamacpp.completion(messages, response_format)
-    resp = {
-        'resp_str': resp_llamacpp.choices[0].message.content,
-        'finish_reason': resp_llamacpp.choices[0].finish_reason
-    }
+    resp_str, finish_reason = llamacpp.completion_text(
+        messages, response_format
+    )
+    resp = {'resp_str': resp_str, 'finish_reason': finish_reason}
     return resp
 
 
@@ -147,25 +172,28 @@ def retry_with_exponential_backoff(
     wait_before_request_min: float = 0,
     wait_before_request_max: float = 5,
     minimum_backoff: float = 1,
+    maximum_backoff: float = 60,
     exponential_base: float = 2,
     jitter: bool = True,
     max_retries: int = 100
 ):
+    throttle_first_request = wait_before_request_max > 0
+
     def wrapper(*args, **kwargs):
+        if throttle_first_request:
+            wait_before = wait_before_request_min + \
+                (wait_before_request_max-wait_before_request_min) * random()
+            if wait_before > 0:
+                logger.info(
+                    f"Throttling: Waiting for {wait_before:.1f} " + 
+                    "seconds before sending completion request."
+                )
+                time.sleep(wait_before)
+
         num_retries = 0
         delay = minimum_backoff
-
         while True:
             try:
-                wait_before = wait_before_request_min + \
-                    (wait_before_request_max-wait_before_request_min) *\
-                    random()
-                if wait_before > 0 and num_retries == 0:
-                    logger.info(
-                        f"Throttling: Waiting for {wait_before:.1f} " + 
-                        "seconds before sending completion request."
-                    )
-                    time.sleep(wait_before)
                 return func(*args, **kwargs)
 
             except Exception as e:
@@ -175,7 +203,8 @@ def retry_with_exponential_backoff(
                         "Throttling: Maximum number of retries " + 
                         f"({max_retries}) exceeded."
                     )
-                delay *= exponential_base * (1 + jitter * random())
+                delay *= exponential_base * (1 + random() if jitter else 1)
+                delay = min(delay, maximum_backoff)
                 logger.info(
                     f"Throttling: Request error: '{e}'. "+ 
                     f"Retrying in {delay:.2f} seconds."
@@ -186,35 +215,29 @@ def retry_with_exponential_backoff(
 
 @retry_with_exponential_backoff
 def litellm_completion_with_backoff(**kwargs):
-    return litellm_completion(**kwargs)
+    return _litellm_completion(**kwargs)
 
 @retry_with_exponential_backoff
 def instructor_completion_with_backoff(**kwargs):
     return instructor_completion(**kwargs)
 
 def completion(**kwargs):
-    model = kwargs.get("model")
+    throttle = kwargs.pop("throttle", False)
+    llamacpp = kwargs.pop("llamacpp", None)
+    model = kwargs["model"]
 
     if model == "llamacpp":
-        kwargs.pop("throttle", None)
-        return llamacpp_completion(**kwargs)
-    
-    kwargs.pop("llamacpp", None)
+        return llamacpp_completion(llamacpp=llamacpp, **kwargs)
     
     if model_supports_response_schema(model):
-        if kwargs.get("throttle"):
+        if throttle:
             return litellm_completion_with_backoff(
                 num_retries = 0, max_retries = 0, **kwargs
             )
-        else:
-            kwargs.pop("throttle", None)
-            return litellm_completion(**kwargs)
+        return litellm_completion(**kwargs)
     else:
-        if kwargs.get("throttle"):
+        if throttle:
             return instructor_completion_with_backoff(
                 num_retries = 0, max_retries = 0, **kwargs
             )
-        else:
-            kwargs.pop("throttle", None)
-            return instructor_completion(**kwargs)
-
+        return instructor_completion(**kwargs)
@@ -1,82 +1,132 @@
+import mmap
+import os
 import struct
+from collections import namedtuple
+from functools import lru_cache
+
+# GGUF files are little-endian. The header consists of the magic number,
+# the version (uint32), the tensor count (uint64) and the metadata
+# key-value count (uint64), followed by the key-value pairs.
+_U32 = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+_HEADER_SIZE = 24
+
+# Precompiled structs for the fixed-width GGUF value types. Strings (8)
+# and arrays (9) are variable-width and have their own readers.
+VALUE_STRUCTS = {
+    0: struct.Struct("<B"),   # UINT8
+    1: struct.Struct("<b"),   # INT8
+    2: struct.Struct("<H"),   # UINT16
+    3: struct.Struct("<h"),   # INT16
+    4: _U32,                  # UINT32
+    5: struct.Struct("<i"),   # INT32
+    6: struct.Struct("<f"),   # FLOAT32
+    7: struct.Struct("<?"),   # BOOL
+    10: _U64,                 # UINT64
+    11: struct.Struct("<q"),  # INT64
+    12: struct.Struct("<d"),  # FLOAT64
+}
+
+# Sizes in bytes of the fixed-width GGUF value types
+VALUE_SIZES = {k: v.size for k, v in VALUE_STRUCTS.items()}
+
+GGUFArray = namedtuple('GGUFArray', ['element_type', 'length', 'offset'])
 
 class GGUFParser:
     def __init__(self, gguf_file_path):
         self.gguf_file_path = gguf_file_path
-    
+
 
     def get_metadata(self):
         meta_data = {}
-        with open(self.gguf_file_path, 'rb') as f:
-            magic_number = f.read(4)
-            if magic_number != b"GGUF":
+        with open(self.gguf_file_path, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            if buf[:4] != b"GGUF":
                 raise ValueError("Invalid GGUF file")
 
-            version = struct.unpack("I", f.read(4))[0]
+            version = _U32.unpack_from(buf, 4)[0]
             if version != 3:
                 raise ValueError("Unsupported GGUF version")
 
-            _ = struct.unpack("Q", f.read(8))[0]
-            metadata_kv_count = struct.unpack("Q", f.read(8))[0]
+            metadata_kv_count = _U64.unpack_from(buf, 16)[0]
+            offset = _HEADER_SIZE
+            architecture = None
 
             for _ in range(metadata_kv_count):
-                key = GGUFParser.read_string(f)
-                value_type = struct.unpack("I", f.read(4))[0]
-                value = GGUFParser.read_value(f, value_type)
+                key, offset = GGUFParser.read_string(buf, offset)
+                value_type = _U32.unpack_from(buf, offset)[0]
+                value, offset = GGUFParser.read_value(
+                    buf, offset + _U32.size, value_type
+                )
 
-                if 'context_length' in key:
+                # botex only needs the context length of the model, stored
+                # as '<architecture>.context_length'. Other keys can contain
+                # 'context_length' as well (e.g., the original context 
+                # length of rope scaling), so they only serve as a fallback
+                # for files that do not name their architecture. The key 
+                # precedes the large tokenizer arrays, which are therefore 
+                # not read.
+                if key == 'general.architecture':
+                    architecture = value
+                elif key == f"{architecture}.context_length":
+                    meta_data['context_length'] = value
+                    break
+                elif 'context_length' in key:
                     meta_data['context_length'] = value
-                
-        
+
         return meta_data
 
+    # The read_* methods decode a value from the buffer at the given offset
+    # and return it together with the offset of the next value.
+
     @staticmethod
-    def read_string(file):
-        length = struct.unpack("Q", file.read(8))[0]
-        return file.read(length).decode('utf-8')
-    
+    def read_string(buf, offset):
+        length = _U64.unpack_from(buf, offset)[0]
+        offset += _U64.size
+        return buf[offset:offset + length].decode('utf-8'), offset + length
+
     @staticmethod
-    def read_array(file, element_type):
-        length = struct.unpack("Q", file.read(8))[0]
-        if element_type == "str":
-            return [GGUFParser.read_string(file) for _ in range(length)]
-        elif element_type == "f32":
-            return struct.unpack(f"{length}f", file.read(length * 4))
-        elif element_type == "i32":
-            return struct.unpack(f"{length}i", file.read(length * 4))
+    def read_array(buf, offset, element_type):
+        # botex does not need array values (e.g., the tokenizer vocabulary),
+        # so arrays are skipped without decoding them. The returned 
+        # GGUFArray records where the array data starts in the file.
+        length = _U64.unpack_from(buf, offset)[0]
+        offset += _U64.size
+        start = offset
+        if element_type == 8:
+            for _ in range(length):
+                offset += _U64.size + _U64.unpack_from(buf, offset)[0]
+        elif element_type in VALUE_SIZES:
+            offset += length * VALUE_SIZES[element_type]
         else:
-            raise ValueError(f"Unsupported array element type: {element_type}")
-        
+            raise ValueError(f"Unsupported array type: {element_type}")
+        return GGUFArray(element_type, length, start), offset
+
     @staticmethod
-    def read_value(file, value_type):
-        VALUE_FORMATS = {
-            0: "B",  # UINT8
-            1: "b",  # INT8
-            2: "H",  # UINT16
-            3: "h",  # INT16
-            4: "I",  # UINT32
-            5: "i",  # INT32
-            6: "f",  # FLOAT32
-            7: "?",  # BOOL
-            10: "Q", # UINT64
-            11: "q", # INT64
-            12: "d", # FLOAT64
-            8: GGUFParser.read_string,  # STRING
-            9: GGUFParser.read_array,   # ARRAY
-        }
-        if value_type in VALUE_FORMATS:
-            if callable(VALUE_FORMATS[value_type]):
-                if value_type == 9:
-                    array_type = struct.unpack("I", file.read(4))[0]
-                    if array_type == 8:
-                        return GGUFParser.read_array(file, "str")
-                    elif array_type == 6:
-                        return GGUFParser.read_array(file, "f32")
-                    elif array_type == 5:
-                        return GGUFParser.read_array(file, "i32")
-                    else:
-                        raise ValueError(f"Unsupported array type: {array_type}")
-                return VALUE_FORMATS[value_type](file)
-            return struct.unpack(VALUE_FORMATS[value_type], file.read(struct.calcsize(VALUE_FORMATS[value_type])))[0]
-        else:
-            raise ValueError("Unsupported value type")
\ No newline at end of file
+    def read_value(buf, offset, value_type):
+        value_struct = VALUE_STRUCTS.get(value_type)
+        if value_struct is not None:
+            value = value_struct.unpack_from(buf, offset)[0]
+            return value, offset + value_struct.size
+        if value_type == 8:
+            return GGUFParser.read_string(buf, offset)
+        if value_type == 9:
+            array_type = _U32.unpack_from(buf, offset)[0]
+            return GGUFParser.read_array(buf, offset + _U32.size, array_type)
+        raise ValueError("Unsupported value type")
+
+
+def get_gguf_metadata(gguf_file_path):
+    """
+    Return the metadata of a GGUF file. Results are cached by path, 
+    modification time and size, so that the file is only parsed again 
+    if it has changed.
+    """
+    stat = os.stat(gguf_file_path)
+    return dict(_read_gguf_metadata(
+        os.path.abspath(gguf_file_path), stat.st_mtime_ns, stat.st_size
+    ))
+
+@lru_cache(maxsize=8)
+def _read_gguf_metadata(gguf_file_path, mtime_ns, size):
+    return GGUFParser(gguf_file_path).get_metadata()
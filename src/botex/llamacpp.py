@@ -1,13 +1,20 @@
+import atexit
+import json
 import logging
 import os
-import psutil
+import platform
 import requests
+import signal
 import subprocess
+import threading
 import time
 
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from functools import lru_cache
 from urllib.parse import urlparse
 
-from .gguf_parser import GGUFParser
+from .gguf_parser import get_gguf_metadata
 
 from pydantic import BaseModel, Field, model_validator, ValidationError
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -37,6 +44,26 @@ class ChatCompletionResponse(BaseModel):
     usage: Usage
     choices: List[Choice]
 
+    @classmethod
+    def from_server(cls, data: dict) -> "ChatCompletionResponse":
+        """
+        Build a response from the JSON returned by the llama.cpp server. 
+        The server output is trusted, so validation is skipped unless the
+        botex logger is set to DEBUG.
+        """
+        if logger.isEnabledFor(logging.DEBUG):
+            return cls.model_validate(data)
+        return cls.model_construct(
+            usage=Usage.model_construct(**data['usage']),
+            choices=[
+                Choice.model_construct(
+                    message=Message.model_construct(**c['message']),
+                    **{k: v for k, v in c.items() if k != 'message'}
+                ) for c in data['choices']
+            ],
+            **{k: v for k, v in data.items() if k not in ('usage', 'choices')}
+        )
+
 class LlamaCppConfig(BaseSettings):
     model_config = SettingsConfigDict(
         env_prefix="LLAMACPP_", env_ignore_empty=True)
@@ -50,6 +77,9 @@ class LlamaCppConfig(BaseSettings):
     top_p: float = Field(default=0.9)
     top_k: int = Field(default=40)
     num_slots: int = Field(default=1)
+    batch_size: int | None = Field(default=None)
+    ubatch_size: int | None = Field(default=None)
+    kv_cache_type: str | None = Field(default=None)
 
     @model_validator(mode='after')
     def check_required_fields(self):
@@ -73,29 +103,76 @@ class LlamaCppConfig(BaseSettings):
             raise FileNotFoundError(
                 f"Model path {self.local_llm_path} not found."
             )
+        return self
+
+    def resolve_context_length(self) -> int:
+        """
+        Return the context length, reading it from the model metadata 
+        (defaulting to 4096) if it has not been provided.
+        """
         if not self.context_length:
-            self.context_length = GGUFParser(
+            self.context_length = get_gguf_metadata(
                 self.local_llm_path
-            ).get_metadata().get("context_length", 4096)
-        return self
+            ).get("context_length", 4096)
+        return self.context_length
+
+    @property
+    def total_context_length(self) -> int:
+        """
+        The context size of the server, which is shared by its slots.
+        """
+        return self.num_slots * self.resolve_context_length()
     
 
-def is_llamacpp_server_reachable(url, timeout=6):
+@lru_cache(maxsize=64)
+def _response_format_payload(response_format) -> dict:
+    """
+    Return the llama.cpp `response_format` for a Pydantic schema. Bots use 
+    the same few schemas on every turn, so the JSON schema is generated 
+    only once per schema class.
+    """
+    return {
+        "type": "json_object",
+        "schema": response_format.model_json_schema()
+    }
+
+
+def is_llamacpp_server_reachable(
+        url, timeout=6, session=None, process=None
+    ):
     """
     Checks if the llama.cpp server at the given host and port is reachable.
+
+    The server is polled with exponential backoff until it is healthy or 
+    `timeout` seconds have passed. A server that responds but is not healthy 
+    yet (e.g., because it is still loading the model) is polled as well. If 
+    the `subprocess.Popen` handle of the server is passed as `process`, 
+    polling stops as soon as that process has exited.
     """
 
     url = f"{url}/health"
-    start_time = time.time()
-    while True:
-        try:
-            response = requests.get(url)
-            if response.status_code == 200:
-                return True
-        except requests.ConnectionError:
-            if time.time() - start_time > timeout:
+    deadline = time.monotonic() + timeout
+    delay = 0.01
+    own_session = session is None
+    if own_session:
+        session = requests.Session()
+    try:
+        while True:
+            try:
+                response = session.get(url, timeout=(0.5, 1))
+                if response.status_code == 200:
+                    return True
+            except (requests.ConnectionError, requests.Timeout):
+                pass
+            if process is not None and process.poll() is not None:
+                return False
+            if time.monotonic() > deadline:
                 return False
-            time.sleep(1)
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+    finally:
+        if own_session:
+            session.close()
 
 
 class LlamaCppServerManager:
@@ -104,7 +181,8 @@ class LlamaCppServerManager:
         self.config = LlamaCppConfig(**config)
 
     def start_server(self) -> subprocess.Popen:
-        if is_llamacpp_server_reachable(self.config.server_url):
+        # A single probe suffices to detect a server that is already running
+        if is_llamacpp_server_reachable(self.config.server_url, timeout=0):
             raise Exception(
                 "A llama.cpp server is already running at " 
                 f"{self.config.server_url}. "
@@ -112,18 +190,27 @@ class LlamaCppServerManager:
             )
 
         parsed_url = urlparse(self.config.server_url)
-        assert self.config.context_length, "Context length should have been set by now."
         cmd = [
             self.config.server_path,
             "--host", parsed_url.hostname,
             "--port", str(parsed_url.port),
             "-ngl", str(self.config.number_of_layers_to_offload_to_gpu),
             "-m", self.config.local_llm_path,
-            "-c", str(int(self.config.num_slots) * self.config.context_length),
+            "-c", str(self.config.total_context_length),
             "-n", str(self.config.maximum_tokens_to_predict),
             "--parallel", str(self.config.num_slots),
+            "--cont-batching",
             "-fa",
         ]
+        if self.config.batch_size:
+            cmd += ["--batch-size", str(self.config.batch_size)]
+        if self.config.ubatch_size:
+            cmd += ["--ubatch-size", str(self.config.ubatch_size)]
+        if self.config.kv_cache_type:
+            cmd += [
+                "--cache-type-k", self.config.kv_cache_type,
+                "--cache-type-v", self.config.kv_cache_type
+            ]
 
         logger.info(
             f"Starting llama.cpp server '{self.config.server_path} "
@@ -131,42 +218,125 @@ class LlamaCppServerManager:
             f"listening to {self.config.server_url}... "
         )
         # Should the log file path become a configurable option at some point?
+        # The server runs in its own process group so that it can be 
+        # stopped together with any processes it spawns in one call
         with open("llama.log", "a") as log_file:
-            process = subprocess.Popen(
-                cmd, stdout=log_file, stderr=subprocess.STDOUT
-            )
-
-        if not is_llamacpp_server_reachable(self.config.server_url):
+            # A failed start is diagnosed from the output of this run only
+            log_offset = log_file.tell()
+            if platform.system() == "Windows":
+                process = subprocess.Popen(
+                    cmd, stdout=log_file, stderr=subprocess.STDOUT,
+                    creationflags=subprocess.CREATE_NEW_PROCESS_GROUP
+                )
+            else:
+                process = subprocess.Popen(
+                    cmd, stdout=log_file, stderr=subprocess.STDOUT,
+                    start_new_session=True
+                )
+        # Being in its own process group, the server does not receive the
+        # Ctrl-C of the terminal, so make sure that it does not outlive botex
+        atexit.register(self.terminate_process, process)
+
+        # Large models take a while to load, so allow for three seconds per 
+        # GB of model size, but at least a minute
+        model_size_gb = os.path.getsize(self.config.local_llm_path) / 1e9
+        if not is_llamacpp_server_reachable(
+            self.config.server_url, timeout=max(60, 3 * model_size_gb),
+            process=process
+        ):
             self.terminate_process(process)
+            with open("llama.log", "rb") as log_file:
+                log_file.seek(0, os.SEEK_END)
+                log_file.seek(max(log_file.tell() - 8192, log_offset))
+                log_tail = log_file.read()
+            if b"out of memory" in log_tail:
+                raise Exception(
+                    "Failed to start llama.cpp server as it ran out of "
+                    "memory. Consider offloading fewer layers to the GPU "
+                    "or reducing the context length or number of slots."
+                )
             raise Exception(
-                "Failed to start llama.cpp server. Check the logs for details."
+                "Failed to start llama.cpp server. Check the logs "
+                "(llama.log) for details."
             )
 
         logger.info(
             "llama.cpp server started successfully. "
-            "Logging output to llama_cpp_server.log"
+            "Logging output to llama.log"
         )
+        LlamaCpp._register_server(self.config.server_url, process)
+        self.warm_up()
         return process
 
+    def warm_up(self):
+        """
+        Send a one-token completion to the server so that the one-time 
+        initialization of the first request does not slow down the first 
+        bot. Failures are logged but not raised.
+        """
+        url = f"{self.config.server_url.rstrip('/')}/v1/chat/completions"
+        start = time.monotonic()
+        try:
+            response = requests.post(
+                url, timeout=900, json={
+                    "messages": [{"role": "user", "content": "Hi"}],
+                    "max_tokens": 1, "temperature": 0
+                }
+            )
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logger.warning(f"Warming up the llama.cpp server failed: {e}")
+            return
+        logger.info(
+            "llama.cpp server warmed up in "
+            f"{time.monotonic() - start:.1f} seconds."
+        )
+
         
     @staticmethod
     def stop_server(process: subprocess.Popen):
         if process:
             logger.info("Stopping llama.cpp server...")
-            parent = psutil.Process(process.pid)
-            for child in parent.children(recursive=True):
-                child.terminate()
-            parent.terminate()
-            process.wait()
+            if process.poll() is not None:
+                logger.warning("llama.cpp server has already exited.")
+                return
+            if platform.system() == "Windows":
+                import psutil
+                parent = psutil.Process(process.pid)
+                procs = [parent, *parent.children(recursive=True)]
+                for proc in procs:
+                    proc.terminate()
+                _, alive = psutil.wait_procs(procs, timeout=5)
+                for proc in alive:
+                    proc.kill()
+                process.wait()
+            else:
+                try:
+                    # Only signal the process group if the server leads it. 
+                    # A server started without its own session shares the 
+                    # process group of the caller, which must not be signalled.
+                    if os.getpgid(process.pid) == process.pid:
+                        send_signal = lambda sig: os.killpg(process.pid, sig)
+                    else:
+                        send_signal = process.send_signal
+                    send_signal(signal.SIGTERM)
+                    try:
+                        process.wait(timeout=5)
+                    except subprocess.TimeoutExpired:
+                        send_signal(signal.SIGKILL)
+                        process.wait()
+                except ProcessLookupError:
+                    process.wait()
             logger.info("llama.cpp server stopped.")
         else:
             logger.warning("No running llama.cpp server found to stop.")
 
     @staticmethod
     def terminate_process(process=None):
-        if process:
-            process.terminate()
-            process.wait()
+        # Stops the server together with the processes it spawned, within 
+        # the time bound of stop_server, unless it has already exited
+        if process and process.poll() is None:
+            LlamaCppServerManager.stop_server(process)
 
 
 class LlamaCpp:
@@ -176,25 +346,85 @@ class LlamaCpp:
     Parameters:
     api_base (str): The base URL of the llama.cpp server. This should include 
         the protocol (http/https) and domain/host (e.g., "http://localhost:8080").
+    cache_prompt (bool): Whether the server may reuse the KV cache of a 
+        previous request that shares a prefix with the current one. Defaults 
+        to True. Set to False if you need results that do not depend on 
+        which requests the server has processed before.
     """
-    def __init__(self, api_base: str | None = "http://localhost:8080"):
+    # Bots using the same server send at most as many completion requests 
+    # at once as the server has slots. The server processes these in one 
+    # batch instead of queuing requests that wait (and time out) for a slot.
+    _slot_semaphores = {}
+    _slot_semaphores_lock = threading.Lock()
+
+    # Bots using a server that botex started only request its properties 
+    # once. An entry holds the server process and is only used while that 
+    # process is running, as a server restarted at the same URL can have 
+    # another model or number of slots. Properties of servers that botex 
+    # did not start are always requested from the server.
+    _props_cache = {}
+    _props_cache_lock = threading.Lock()
+
+    def __init__(
+            self, api_base: str | None = "http://localhost:8080",
+            cache_prompt: bool = True
+        ):
         if not api_base:
             api_base = "http://localhost:8080"
         self.api_base = api_base.rstrip("/")
-        if not is_llamacpp_server_reachable(self.api_base):
+        self._completion_url = f"{self.api_base}/v1/chat/completions"
+        self.cache_prompt = cache_prompt
+        # The session keeps the connection to the server alive, so that 
+        # completions do not connect anew for each request
+        self._session = requests.Session()
+        # llama.cpp does not compress its responses
+        self._session.headers["Accept-Encoding"] = "identity"
+        if not is_llamacpp_server_reachable(
+            self.api_base, session=self._session
+        ):
             raise Exception(
                 f"Cannot connect to llama.cpp server at {self.api_base}." 
                 "Please ensure the server is running."
             )
         # Fetch metadata from the server
         self.set_params_from_running_api()
+        # Completion requests that fail to connect or hit a transient server
+        # error are retried by urllib3 with backoff. A couple of retries 
+        # suffice as the server is local, and each attempt can take long. 
+        # This adapter is mounted after the health check so that it does 
+        # not retry the polling requests.
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=max(int(self.num_slots), 1) * 2,
+            max_retries=Retry(
+                total=2, backoff_factor=0.5, allowed_methods=None,
+                status_forcelist=[429, 500, 502, 503, 504], 
+                respect_retry_after_header=True, raise_on_status=False
+            )
+        )
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        with LlamaCpp._slot_semaphores_lock:
+            self._slots = LlamaCpp._slot_semaphores.setdefault(
+                (self.api_base, self.num_slots),
+                threading.BoundedSemaphore(max(int(self.num_slots), 1))
+            )
 
     def set_params_from_running_api(self):
         url = f"{self.api_base}/props"
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            res = response.json()
+            with LlamaCpp._props_cache_lock:
+                process, res = LlamaCpp._props_cache.get(
+                    self.api_base, (None, None)
+                )
+            if process is None or process.poll() is not None:
+                process, res = None, None
+            if res is None:
+                response = self._session.get(url)
+                response.raise_for_status()
+                res = json.loads(response.content)
+                if process is not None:
+                    with LlamaCpp._props_cache_lock:
+                        LlamaCpp._props_cache[self.api_base] = (process, res)
             if "model_path" in res:
                 self.local_llm_path = res['model_path']
             elif "model" in res['default_generation_settings']:
@@ -215,7 +445,7 @@ class LlamaCpp:
             self.temperature = 0.8
             self.top_p = 0.9
             self.top_k = 40
-        except requests.RequestException as req_exc:
+        except (requests.RequestException, ValueError) as req_exc:
             raise Exception(
                 "Failed to retrieve metadata from llama.cpp server "
                 f"at {self.api_base}: {req_exc}"
@@ -229,6 +459,21 @@ class LlamaCpp:
             )
 
 
+    @classmethod
+    def _register_server(cls, api_base: str, process: subprocess.Popen):
+        """
+        Allow the properties of the server at `api_base`, started as 
+        `process`, to be cached while the process is running.
+        """
+        with cls._props_cache_lock:
+            cls._props_cache[api_base.rstrip("/")] = (process, None)
+
+    def close(self):
+        """
+        Close the connections of this client to the llama.cpp server.
+        """
+        self._session.close()
+
     def json_dump_model_cfg(self):
         return {
             "api_base": self.api_base,
@@ -239,6 +484,7 @@ class LlamaCpp:
             "temperature": self.temperature,
             "top_p": self.top_p,
             "top_k": self.top_k,
+            "cache_prompt": self.cache_prompt,
         }    
     
 
@@ -254,36 +500,68 @@ class LlamaCpp:
         Returns:
         ChatCompletionResponse: The completion response.
         """
-        url = f"{self.api_base}/v1/chat/completions"
+        return ChatCompletionResponse.from_server(
+            self._request_completion(messages, response_format)
+        )
+
+    def completion_text(
+            self, messages, response_format=None
+        ) -> tuple[str, str | None]:
+        """
+        Generates a llama.cpp completion for the given messages and returns
+        only the content and finish reason of the first choice, without 
+        building a ChatCompletionResponse.
+
+        Parameters:
+        messages (list): A list of messages to generate the completion for.
+        response_format (PydanticModel): A Pydantic schema for the expected 
+            response format.
+
+        Returns:
+        tuple: The content of the completion and its finish reason.
+        """
+        choice = self._request_completion(messages, response_format)['choices'][0]
+        return choice['message']['content'], choice.get('finish_reason')
+
+    def _request_completion(self, messages, response_format=None) -> dict:
+        url = self._completion_url
 
         payload = {
             "messages": messages,
             "temperature": self.temperature,
-            "cache_prompt": False,
+            # Reuse the KV cache of the common prefix (system prompt and 
+            # conversation so far) that bots resend on every turn
+            "cache_prompt": self.cache_prompt,
             "max_tokens": self.max_tokens,
             "top_p": self.top_p,
             "top_k": self.top_k,
         }
 
         if response_format:
-            payload["response_format"] = {
-                "type": "json_object",
-                "schema": response_format.model_json_schema()
-            }
+            payload["response_format"] = _response_format_payload(
+                response_format
+            )
 
-        attempts = 0
-        while attempts < 3:
-            try:
-                response = requests.post(url, json=payload, timeout=900)
-                response.raise_for_status()
-                return ChatCompletionResponse(**response.json())
-            except requests.RequestException as e:
-                attempts += 1
-                logger.error(
-                    f"Error getting a response: {e}. Retrying... ({attempts}/3)"
+        body = json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        response = None
+        try:
+            with self._slots:
+                response = self._session.post(
+                    url, data=body, headers=headers, timeout=(5, 900)
                 )
-                if attempts == 3:
-                    raise Exception("Request failed after 3 attempts.")
+            response.raise_for_status()
+            return json.loads(response.content)
+        except (requests.RequestException, ValueError) as e:
+            if getattr(e, "response", None) is not None:
+                response = e.response
+            detail = ""
+            if response is not None and response.text:
+                detail = f" Server response: {response.text[:1000]}"
+            logger.error(f"Error getting a response: {e}.{detail}")
+            raise Exception(
+                f"llama.cpp completion failed: {e}.{detail}"
+            ) from e
 
 def start_llamacpp_server(config: dict | None = None) -> subprocess.Popen:
     """
@@ -300,7 +578,8 @@ def start_llamacpp_server(config: dict | None = None) -> subprocess.Popen:
 
     Returns:
         The process of the running llama.cpp sever if start was
-            successful.
+            successful. If the server is still running when the Python
+            interpreter exits, it is stopped at that point.
 
     Raises:
         Exception: If the server is already running or if starting the server 
@@ -336,6 +615,18 @@ def start_llamacpp_server(config: dict | None = None) -> subprocess.Popen:
             -   `num_slots` (int): The number of slots for the model, 
                 defaults to `1`.
 
+            -   `batch_size` (int): The logical batch size for prompt 
+                processing. If `None` (the default), llama.cpp's default 
+                is used.
+
+            -   `ubatch_size` (int): The physical batch size for prompt 
+                processing. If `None` (the default), llama.cpp's default 
+                is used.
+
+            -   `kv_cache_type` (str): The data type of the KV cache, e.g., 
+                `"q8_0"` to halve its memory use. If `None` (the default), 
+                llama.cpp's default (`"f16"`) is used.
+
 
         For all these keys, if not provided in the configuration dictionary, 
         botex will try to get the value from environment variables (in all 
@@ -7,10 +7,10 @@ import os
 import shutil
 import csv
 import tempfile
-import sqlite3
 from threading import Thread
 from random import shuffle
 from itertools import compress
+from functools import partial
 import requests
 from typing import List
 
@@ -24,7 +24,13 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
 from .bot import run_bot
+from .botex_db import connect_botex_db, close_botex_db
 
+INSERT_PARTICIPANT_SQL = """
+    INSERT INTO participants (
+        session_name, session_id, participant_id, is_human, url) 
+        VALUES (?, ?, ?, ?, ?) 
+"""
 
 def setup_botex_db(botex_db = None):
     """
@@ -37,8 +43,9 @@ def setup_botex_db(botex_db = None):
         the environment variable BOTEX_DB.
     """
     if botex_db is None: botex_db = os.environ.get('BOTEX_DB')
-    conn = sqlite3.connect(botex_db)
+    conn = connect_botex_db(botex_db)
     cursor = conn.cursor()
+    cursor.execute("PRAGMA journal_mode = WAL")
     cursor.execute(
         "SELECT name FROM sqlite_master WHERE type='table' AND name='participants'"
     )
@@ -67,6 +74,21 @@ def setup_botex_db(botex_db = None):
             """
         )
         conn.commit()
+    # Bots look up their participant rows by session and conversations
+    # are looked up by participant ID. Created for existing databases, too.
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_participants_session_is_human 
+        ON participants (session_id, is_human)
+        """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_conversations_id 
+        ON conversations (id)
+        """
+    )
+    conn.commit()
     cursor.close()
     return conn
 
@@ -108,7 +130,9 @@ def call_otree_api(
     return resp.json()
 
 
-def otree_server_is_running(server_url = None, rest_key = None) -> bool:
+def otree_server_is_running(
+        server_url = None, rest_key = None, timeout = None
+    ) -> bool:
     """
     Check if an oTree server is running.
 
@@ -117,13 +141,15 @@ def otree_server_is_running(server_url = None, rest_key = None) -> bool:
             variable OTREE_SERVER_URL if None (the default).
         rest_key (str): The API key for the oTree server. Read from environment
             variable OTREE_REST_KEY if None (the default).
+        timeout (float): Timeout in seconds for the request to the oTree 
+            server. If None (the default), the request does not time out.
 
     Returns:
         True if the server is running, False otherwise.
     """
     try: 
         data = call_otree_api(
-            requests.get, 'otree_version', 
+            partial(requests.get, timeout=timeout), 'otree_version', 
             otree_server_url=server_url, otree_rest_key=rest_key
         )
     except:
@@ -362,17 +388,12 @@ def init_otree_session(
         part_codes, is_human, urls
     )
 
+    # Insert all participants in a single transaction. rows is a lazy 
+    # iterator, so it is streamed into executemany() without materializing
     conn = setup_botex_db(botex_db)
-    cursor = conn.cursor()
-    cursor.executemany(
-        """
-        INSERT INTO participants (
-            session_name, session_id, participant_id, is_human, url) 
-            VALUES (?, ?, ?, ?, ?) 
-        """, rows
-    )
-    conn.commit()
-    cursor.close()
+    with conn:
+        conn.executemany(INSERT_PARTICIPANT_SQL, rows)
+    close_botex_db(conn)
     return {
         'session_id': session_id, 
         'participant_code': part_codes,
@@ -405,18 +426,23 @@ def get_bot_urls(
     """
 
     if botex_db is None: botex_db = os.environ.get('BOTEX_DB')
-    conn = sqlite3.connect(botex_db)
+    conn = connect_botex_db(botex_db)
     cursor = conn.cursor()
-    cursor.execute(
-        """
-        SELECT url,time_in,time_out FROM participants 
-        WHERE session_id = ? AND is_human = 0
-        """, (session_id,)
-    )
     if already_started:
-        urls = [row[0] for row in cursor.fetchall() if row[2] is None]
+        cursor.execute(
+            """
+            SELECT url FROM participants 
+            WHERE session_id = ? AND is_human = 0 AND time_out IS NULL
+            """, (session_id,)
+        )
     else:
-        urls = [row[0] for row in cursor.fetchall() if row[1] is None]
+        cursor.execute(
+            """
+            SELECT url FROM participants 
+            WHERE session_id = ? AND is_human = 0 AND time_in IS NULL
+            """, (session_id,)
+        )
+    urls = [row[0] for row in cursor.fetchall()]
     cursor.close()
     conn.close()
     return urls
@@ -492,7 +518,9 @@ def run_bots_on_session(
         wait (bool): If True (the default), the function will wait for the bots 
             to finish.
         kwargs (dict): Additional keyword arguments to pass on to
-            `litellm.completion()`.
+            `litellm.completion()`. When using llama.cpp, you can pass
+            `cache_prompt=False` to keep the server from reusing cached
+            prompt prefixes.
         
     Returns:
         None (bot conversation logs are stored in database) if wait is True. A list of Threads running the bots if wait is False.
@@ -667,7 +695,9 @@ def run_single_bot(
         wait (bool): If True (the default), the function will wait for the bots 
             to finish.
         kwargs (dict): Additional keyword arguments to pass on to
-            `litellm.completion()`.
+            `litellm.completion()`. When using llama.cpp, you can pass
+            `cache_prompt=False` to keep the server from reusing cached
+            prompt prefixes.
         
     Returns:
         None (conversation is stored in the botex database) if wait is True.
@@ -745,16 +775,12 @@ def run_single_bot(
     is_human = 0
 
     conn = setup_botex_db(botex_db)
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        INSERT INTO participants (
-            session_name, session_id, participant_id, is_human, url) 
-            VALUES (?, ?, ?, ?, ?) 
-        """, (session_name, session_id, participant_id, is_human, url,)
-    )
-    conn.commit()
-    cursor.close()
+    with conn:
+        conn.execute(
+            INSERT_PARTICIPANT_SQL,
+            (session_name, session_id, participant_id, is_human, url,)
+        )
+    close_botex_db(conn)
     if wait:
         run_bot(
             botex_db = botex_db, 
@@ -20,6 +20,13 @@ def test_botex_db():
     )
     table_exists = cursor.fetchone()
     assert table_exists
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type='index' ORDER BY name"
+    )
+    indexes = [row[0] for row in cursor.fetchall()]
+    assert indexes == [
+        'idx_conversations_id', 'idx_participants_session_is_human'
+    ]
     cursor.close()
     conn.close()
     delete_botex_db(temp_file)
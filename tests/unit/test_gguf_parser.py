@@ -0,0 +1,124 @@
+import struct
+import pytest
+from src.botex.gguf_parser import GGUFParser, get_gguf_metadata, _read_gguf_metadata
+
+def gguf_string(s):
+    b = s.encode('utf-8')
+    return struct.pack("<Q", len(b)) + b
+
+def write_gguf(path, kvs, version=3):
+    """Write a minimal GGUF file containing only the metadata key-values."""
+    body = b""
+    for key, value_type, payload in kvs:
+        body += gguf_string(key) + struct.pack("<I", value_type) + payload
+    with open(path, 'wb') as f:
+        f.write(b"GGUF" + struct.pack("<IQQ", version, 0, len(kvs)) + body)
+    return str(path)
+
+def gguf_array(array_type, payload, length):
+    return struct.pack("<IQ", array_type, length) + payload
+
+tokens = ["<s>", "</s>", "hällo"]
+test_kvs = [
+    ("general.name", 8, gguf_string("test-model")),
+    ("general.file_type", 4, struct.pack("<I", 7)),
+    ("llama.context_length", 4, struct.pack("<I", 8192)),
+    ("llama.rope.freq_base", 6, struct.pack("<f", 10000.0)),
+    (
+        "tokenizer.ggml.tokens", 9,
+        gguf_array(8, b"".join(gguf_string(t) for t in tokens), len(tokens))
+    ),
+    (
+        "tokenizer.ggml.scores", 9,
+        gguf_array(6, struct.pack("<3f", 0.0, -1.0, -2.0), 3)
+    ),
+    (
+        "tokenizer.ggml.token_type", 9,
+        gguf_array(5, struct.pack("<3i", 1, 3, 1), 3)
+    ),
+    ("general.quantized", 7, struct.pack("<?", True)),
+]
+
+@pytest.mark.unit
+def test_gguf_metadata_context_length(tmp_path):
+    """Test that the context length is parsed after scalars and arrays."""
+    path = write_gguf(tmp_path / "model.gguf", test_kvs)
+    assert GGUFParser(path).get_metadata() == {'context_length': 8192}
+
+@pytest.mark.unit
+def test_gguf_metadata_without_context_length(tmp_path):
+    """Test that a file without context length returns empty metadata."""
+    path = write_gguf(tmp_path / "model.gguf", test_kvs[:2])
+    assert GGUFParser(path).get_metadata() == {}
+
+@pytest.mark.unit
+@pytest.mark.parametrize("content, error", [
+    (b"GGML" + struct.pack("<IQQ", 3, 0, 0), "Invalid GGUF file"),
+    (b"GGUF" + struct.pack("<IQQ", 2, 0, 0), "Unsupported GGUF version"),
+])
+def test_gguf_invalid_header(tmp_path, content, error):
+    """Test that invalid magic numbers and versions are rejected."""
+    path = tmp_path / "model.gguf"
+    path.write_bytes(content)
+    with pytest.raises(ValueError) as excinfo:
+        GGUFParser(str(path)).get_metadata()
+    assert error in str(excinfo.value)
+
+@pytest.mark.unit
+def test_gguf_arrays_are_skipped(tmp_path):
+    """Test that arrays of any fixed-width type are skipped, not decoded."""
+    kvs = [
+        ("tokenizer.ggml.ids", 9, gguf_array(4, struct.pack("<2I", 1, 2), 2)),
+        test_kvs[4],
+        ("llama.context_length", 4, struct.pack("<I", 4096)),
+    ]
+    path = write_gguf(tmp_path / "model.gguf", kvs)
+    assert GGUFParser(path).get_metadata() == {'context_length': 4096}
+
+    with open(path, 'rb') as f:
+        buf = f.read()
+    _, offset = GGUFParser.read_string(buf, 24)
+    value, offset = GGUFParser.read_value(buf, offset + 4, 9)
+    assert value.element_type == 4
+    assert value.length == 2
+    key, _ = GGUFParser.read_string(buf, offset)
+    assert key == "tokenizer.ggml.tokens"
+
+@pytest.mark.unit
+def test_gguf_metadata_is_cached_until_file_changes(tmp_path):
+    """Test that metadata is re-read only when the file has changed."""
+    path = write_gguf(tmp_path / "model.gguf", test_kvs)
+    hits = _read_gguf_metadata.cache_info().hits
+    assert get_gguf_metadata(path) == {'context_length': 8192}
+    assert get_gguf_metadata(path) == {'context_length': 8192}
+    assert _read_gguf_metadata.cache_info().hits == hits + 1
+
+    kvs = test_kvs[:2] + [("llama.context_length", 10, struct.pack("<Q", 32))]
+    write_gguf(path, kvs)
+    assert get_gguf_metadata(path) == {'context_length': 32}
+
+@pytest.mark.unit
+def test_gguf_metadata_stops_after_context_length(tmp_path):
+    """Test that key-values after the context length are not read."""
+    kvs = [("general.architecture", 8, gguf_string("llama"))] + \
+        test_kvs[:3] + [("unsupported", 99, b"")]
+    path = write_gguf(tmp_path / "model.gguf", kvs)
+    assert GGUFParser(path).get_metadata() == {'context_length': 8192}
+
+@pytest.mark.unit
+def test_gguf_metadata_uses_architecture_context_length(tmp_path):
+    """Test that rope scaling keys do not override the context length."""
+    kvs = [
+        ("general.architecture", 8, gguf_string("qwen2")),
+        ("qwen2.context_length", 4, struct.pack("<I", 131072)),
+        (
+            "qwen2.rope.scaling.original_context_length", 4,
+            struct.pack("<I", 32768)
+        ),
+    ]
+    path = write_gguf(tmp_path / "model.gguf", kvs)
+    assert GGUFParser(path).get_metadata() == {'context_length': 131072}
+
+    # Without an architecture, the last matching key is used
+    path = write_gguf(tmp_path / "model.gguf", kvs[1:])
+    assert GGUFParser(path).get_metadata() == {'context_length': 32768}
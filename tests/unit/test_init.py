@@ -0,0 +1,22 @@
+import inspect
+import pytest
+
+@pytest.mark.unit
+def test_package_exports_completion_function():
+    """Test that botex.completion stays the function once botex.bot is loaded."""
+    import botex
+    import botex.bot
+    assert inspect.isfunction(botex.completion)
+    assert botex.completion is botex.bot.completion
+
+@pytest.mark.unit
+@pytest.mark.parametrize("name", [
+    "model_supports_response_schema", "StartSchema", "SummarySchema",
+    "EndSchema", "Phase", "create_answers_response_model", "GGUFParser",
+    "MAX_NUM_OF_ANSWER_ATTEMPTS"
+])
+def test_package_exports_api(name):
+    """Test that the API of the submodules is available from the package."""
+    import botex
+    assert getattr(botex, name) is not None
+    assert name in dir(botex)
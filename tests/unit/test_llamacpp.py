@@ -0,0 +1,394 @@
+import atexit
+import json
+import logging
+import psutil
+import subprocess
+import sys
+import threading
+import time
+import pytest
+import requests
+from src.botex.llamacpp import (
+    ChatCompletionResponse, LlamaCpp, LlamaCppConfig, LlamaCppServerManager,
+    is_llamacpp_server_reachable
+)
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def get(self, url, timeout=None):
+        self.calls += 1
+        response = self.responses.pop(0) if self.responses else None
+        if response is None:
+            raise requests.ConnectionError("Connection refused")
+        return FakeResponse(response)
+
+@pytest.mark.unit
+def test_reachable_waits_for_healthy_server():
+    """Test that a loading server (503) is polled until it is healthy."""
+    session = FakeSession([None, 503, 503, 200])
+    assert is_llamacpp_server_reachable(
+        "http://localhost:8080", session=session
+    )
+    assert session.calls == 4
+
+@pytest.mark.unit
+def test_unreachable_server_times_out():
+    """Test that connection errors give up once the timeout has passed."""
+    session = FakeSession([])
+    assert not is_llamacpp_server_reachable(
+        "http://localhost:8080", timeout=0.2, session=session
+    )
+    assert session.calls > 1
+
+@pytest.mark.unit
+def test_unhealthy_server_times_out():
+    """Test that non-200 responses give up once the timeout has passed."""
+    session = FakeSession([404] * 1000)
+    start = time.monotonic()
+    assert not is_llamacpp_server_reachable(
+        "http://localhost:8080", timeout=0.2, session=session
+    )
+    assert time.monotonic() - start < 1
+    assert session.calls > 1
+
+@pytest.mark.unit
+def test_exited_server_process_fails_fast():
+    """Test that polling stops once the server process has exited."""
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    session = FakeSession([503] * 1000)
+    assert not is_llamacpp_server_reachable(
+        "http://localhost:8080", timeout=60, session=session, process=process
+    )
+    assert session.calls == 1
+
+server_response = {
+    "id": "chatcmpl-1", "object": "chat.completion", "created": 1,
+    "model": "test-model", "system_fingerprint": "b1",
+    "usage": {"completion_tokens": 2, "prompt_tokens": 3, "total_tokens": 5},
+    "choices": [{
+        "index": 0, "finish_reason": "stop",
+        "message": {"role": "assistant", "content": "{\"answer\": 42}"}
+    }]
+}
+
+@pytest.mark.unit
+@pytest.mark.parametrize("level", [logging.INFO, logging.DEBUG])
+def test_completion_response_from_server(level):
+    """Test that server responses are built with and without validation."""
+    logger = logging.getLogger("botex")
+    old_level = logger.level
+    logger.setLevel(level)
+    try:
+        resp = ChatCompletionResponse.from_server(server_response)
+    finally:
+        logger.setLevel(old_level)
+    assert resp.choices[0].message.content == "{\"answer\": 42}"
+    assert resp.choices[0].finish_reason == "stop"
+    assert resp.usage.total_tokens == 5
+    assert resp.model_dump() == ChatCompletionResponse(
+        **server_response
+    ).model_dump()
+
+@pytest.mark.unit
+def test_config_defers_gguf_read(tmp_path):
+    """Test that the model metadata is only read when it is needed."""
+    server_path = tmp_path / "llama-server"
+    model_path = tmp_path / "model.gguf"
+    server_path.write_bytes(b"")
+    model_path.write_bytes(b"not a GGUF file")
+    config = LlamaCppConfig(
+        server_path=str(server_path), local_llm_path=str(model_path)
+    )
+    assert config.context_length is None
+    with pytest.raises(ValueError):
+        config.resolve_context_length()
+    config.context_length = 2048
+    assert config.resolve_context_length() == 2048
+    config.num_slots = 4
+    assert config.total_context_length == 8192
+
+@pytest.mark.unit
+@pytest.mark.skipif(sys.platform == "win32", reason="POSIX process groups")
+def test_stop_server_kills_process_group():
+    """Test that stopping the server also stops the processes it spawned."""
+    process = subprocess.Popen(
+        ["sh", "-c", "sleep 60 & echo $!; wait"],
+        stdout=subprocess.PIPE, start_new_session=True, text=True
+    )
+    child_pid = int(process.stdout.readline())
+    LlamaCppServerManager.stop_server(process)
+    assert process.poll() is not None
+    time.sleep(0.1)
+    try:
+        # The orphaned child may linger as a zombie until it is reaped
+        assert psutil.Process(child_pid).status() == psutil.STATUS_ZOMBIE
+    except psutil.NoSuchProcess:
+        pass
+    process.stdout.close()
+    LlamaCppServerManager.stop_server(process)
+
+@pytest.mark.unit
+def test_stop_server_spares_callers_process_group(monkeypatch):
+    """Test that a server sharing the caller's process group is stopped alone."""
+    process = subprocess.Popen(
+        [sys.executable, "-c", "import time; time.sleep(60)"]
+    )
+    killpg_calls = []
+    monkeypatch.setattr(
+        "src.botex.llamacpp.os.killpg",
+        lambda pgid, sig: killpg_calls.append(pgid)
+    )
+    LlamaCppServerManager.stop_server(process)
+    assert process.poll() is not None
+    assert killpg_calls == []
+
+class FakeCompletionSession:
+    def __init__(self, content=None, status_code=200):
+        if content is None:
+            content = json.dumps(server_response).encode("utf-8")
+        self.content = content
+        self.status_code = status_code
+
+    def post(self, url, data=None, headers=None, timeout=None):
+        self.payload = json.loads(data)
+        response = requests.Response()
+        response.status_code = self.status_code
+        response._content = self.content
+        return response
+
+def completion_client(session):
+    llm = LlamaCpp.__new__(LlamaCpp)
+    llm.api_base = "http://localhost:8080"
+    llm._completion_url = llm.api_base + "/v1/chat/completions"
+    llm._session = session
+    llm._slots = threading.BoundedSemaphore(1)
+    llm.cache_prompt = True
+    llm.max_tokens, llm.temperature, llm.top_p, llm.top_k = 100, 0.8, 0.9, 40
+    return llm
+
+@pytest.mark.unit
+def test_completion_text():
+    """Test that the text fast path returns the content and finish reason."""
+    llm = completion_client(FakeCompletionSession())
+    messages = [{"role": "user", "content": "What is the answer?"}]
+    assert llm.completion_text(messages) == ("{\"answer\": 42}", "stop")
+    assert llm._session.payload["messages"] == messages
+    assert llm._session.payload["cache_prompt"] is True
+    resp = llm.completion(messages)
+    assert resp.choices[0].message.content == "{\"answer\": 42}"
+
+@pytest.mark.unit
+def test_completion_invalid_json():
+    """Test that a response that is not JSON fails the completion."""
+    llm = completion_client(FakeCompletionSession(b"<html>Bad gateway</html>"))
+    messages = [{"role": "user", "content": "What is the answer?"}]
+    with pytest.raises(Exception, match="failed") as excinfo:
+        llm.completion_text(messages)
+    assert not isinstance(excinfo.value, json.JSONDecodeError)
+
+@pytest.mark.unit
+def test_completion_error_includes_server_response():
+    """Test that a failed completion reports the cause and server response."""
+    llm = completion_client(FakeCompletionSession(
+        b'{"error": {"message": "context size exceeded"}}', status_code=400
+    ))
+    messages = [{"role": "user", "content": "What is the answer?"}]
+    with pytest.raises(Exception) as excinfo:
+        llm.completion_text(messages)
+    message = str(excinfo.value)
+    assert message.startswith("llama.cpp completion failed: 400")
+    assert "context size exceeded" in message
+    assert isinstance(excinfo.value.__cause__, requests.HTTPError)
+
+class FakePropsSession:
+    def __init__(self, content=None):
+        if content is None:
+            content = json.dumps({
+                "model_path": "model.gguf", "total_slots": 2,
+                "default_generation_settings": {"n_ctx": 4096, "n_predict": -1}
+            }).encode("utf-8")
+        self.content = content
+        self.calls = 0
+
+    def get(self, url, timeout=None):
+        self.calls += 1
+        response = requests.Response()
+        response.status_code = 200
+        response._content = self.content
+        return response
+
+@pytest.mark.unit
+def test_server_props_are_read_from_running_server():
+    """Test that properties of servers botex did not start are not cached."""
+    session = FakePropsSession()
+    for _ in range(2):
+        llm = LlamaCpp.__new__(LlamaCpp)
+        llm.api_base = "http://localhost:8080"
+        llm._session = session
+        llm.set_params_from_running_api()
+        assert llm.num_slots == 2
+        assert llm.context_length == 4096
+    assert session.calls == 2
+
+@pytest.mark.unit
+def test_started_server_props_are_cached():
+    """Test that the properties of a started server are requested once."""
+    api_base = "http://localhost:8081"
+    process = subprocess.Popen(
+        [sys.executable, "-c", "import time; time.sleep(60)"]
+    )
+    session = FakePropsSession()
+    try:
+        LlamaCpp._register_server(api_base + "/", process)
+        for _ in range(2):
+            llm = LlamaCpp.__new__(LlamaCpp)
+            llm.api_base = api_base
+            llm._session = session
+            llm.set_params_from_running_api()
+            assert llm.num_slots == 2
+        assert session.calls == 1
+    finally:
+        process.kill()
+        process.wait()
+    # Once the server has exited, the cache is not used anymore
+    llm.set_params_from_running_api()
+    assert session.calls == 2
+    LlamaCpp._props_cache.pop(api_base)
+
+@pytest.mark.unit
+def test_server_props_invalid_json():
+    """Test that server properties that are not JSON are reported."""
+    llm = LlamaCpp.__new__(LlamaCpp)
+    llm.api_base = "http://localhost:8080"
+    llm._session = FakePropsSession(b"not json")
+    with pytest.raises(Exception, match="Failed to retrieve metadata"):
+        llm.set_params_from_running_api()
+
+@pytest.mark.unit
+def test_zero_timeout_probes_once():
+    """Test that a zero timeout checks an unreachable server only once."""
+    session = FakeSession([])
+    assert not is_llamacpp_server_reachable(
+        "http://localhost:8080", timeout=0, session=session
+    )
+    assert session.calls == 1
+
+class FakeServerStart:
+    """
+    Stands in for the llama.cpp server process in start_server tests. The 
+    server becomes reachable once it has been started, unless `healthy` is 
+    False, and writes `log_output` to its log on start.
+    """
+    def __init__(self, server_path, model_path):
+        self.server_path = server_path
+        self.model_path = model_path
+        self.healthy = True
+        self.log_output = ""
+        self.process = None
+        self.cmds = []
+        self.hooks = []
+        self.spawned = []
+        self._popen = subprocess.Popen
+
+    def manager(self, **config):
+        return LlamaCppServerManager({
+            "server_path": str(self.server_path),
+            "local_llm_path": str(self.model_path),
+            "context_length": 4096, **config
+        })
+
+    def spawn(self):
+        """Use a real, idle process as the server process."""
+        self.process = self._popen(
+            [sys.executable, "-c", "import time; time.sleep(60)"],
+            start_new_session=True
+        )
+        self.spawned.append(self.process)
+        return self.process
+
+    def popen(self, cmd, stdout=None, **kwargs):
+        self.cmds.append(cmd)
+        if self.log_output:
+            stdout.write(self.log_output)
+        return self.process
+
+    def reachable(self, url, **kwargs):
+        return bool(self.cmds) and self.healthy
+
+@pytest.fixture
+def server_start(tmp_path, monkeypatch):
+    server_path = tmp_path / "llama-server"
+    model_path = tmp_path / "model.gguf"
+    server_path.write_bytes(b"")
+    model_path.write_bytes(b"")
+    fake = FakeServerStart(server_path, model_path)
+    monkeypatch.setattr(
+        "src.botex.llamacpp.is_llamacpp_server_reachable", fake.reachable
+    )
+    monkeypatch.setattr(subprocess, "Popen", fake.popen)
+    monkeypatch.setattr(
+        atexit, "register", lambda func, *args: fake.hooks.append((func, args))
+    )
+    monkeypatch.setattr(LlamaCppServerManager, "warm_up", lambda self: None)
+    monkeypatch.chdir(tmp_path)
+    yield fake
+    for process in fake.spawned:
+        process.kill()
+        process.wait()
+    LlamaCpp._props_cache.pop("http://localhost:8080", None)
+
+@pytest.mark.unit
+def test_start_server_batching_options(server_start):
+    """Test that optional batching settings are passed to the server."""
+    server_start.manager(ubatch_size=1024, kv_cache_type="q8_0").start_server()
+    cmd = server_start.cmds[0]
+    assert "--batch-size" not in cmd
+    assert cmd[cmd.index("--ubatch-size") + 1] == "1024"
+    assert cmd[cmd.index("--cache-type-k") + 1] == "q8_0"
+    assert cmd[cmd.index("--cache-type-v") + 1] == "q8_0"
+
+@pytest.mark.unit
+def test_failed_start_stops_server(server_start, monkeypatch):
+    """Test that a server that fails to start is stopped by stop_server."""
+    server_start.healthy = False
+    process = server_start.spawn()
+    stopped = []
+    monkeypatch.setattr(
+        LlamaCppServerManager, "stop_server", staticmethod(stopped.append)
+    )
+    with pytest.raises(Exception, match="Failed to start"):
+        server_start.manager().start_server()
+    assert stopped == [process]
+
+@pytest.mark.unit
+def test_start_server_reports_out_of_memory(server_start):
+    """Test that an out-of-memory failure in the server log is reported."""
+    server_start.healthy = False
+    manager = server_start.manager()
+    server_start.log_output = "cudaMalloc failed: out of memory\n"
+    with pytest.raises(Exception, match="ran out of memory"):
+        manager.start_server()
+
+    # Out-of-memory errors of earlier runs in the log are ignored
+    server_start.log_output = "error: failed to load model\n"
+    with pytest.raises(Exception, match="Check the logs"):
+        manager.start_server()
+
+@pytest.mark.unit
+def test_started_server_is_stopped_at_exit(server_start):
+    """Test that a started server is stopped when the interpreter exits."""
+    process = server_start.spawn()
+    assert server_start.manager().start_server() is process
+    func, args = server_start.hooks[0]
+    func(*args)
+    assert process.poll() is not None
+    # Servers that have already been stopped are left alone
+    func(*args)